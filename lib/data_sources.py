@@ -1,8 +1,24 @@
-from typing import List, Dict, Any, Optional
+import os, json, time, hashlib, threading
+from datetime import date, timedelta
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from functools import reduce
 import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import numpy as np
 
+try:
+    import orjson
+except ImportError:  # optional accelerator
+    orjson = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # optional accelerator
+    njit = None; prange = range
+
 WMO_CODES = {
     0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
     45: "Fog", 48: "Depositing rime fog",
@@ -15,161 +31,437 @@ WMO_CODES = {
     85: "Snow showers: Slight", 86: "Snow showers: Heavy",
     95: "Thunderstorm: Slight/Moderate", 96: "Thunderstorm with hail: Slight", 99: "Thunderstorm with hail: Heavy"
 }
+# Codes are 0-99, so descriptions can be gathered by array index instead of a per-row dict lookup;
+# the gather yields category codes directly, so the column is stored as a small-int Categorical
+_WMO_CATEGORIES = list(WMO_CODES.values()) + ["Unknown"]
+_WMO_UNKNOWN = len(_WMO_CATEGORIES) - 1
+_WMO_LUT = np.array([_WMO_CATEGORIES.index(WMO_CODES[i]) if i in WMO_CODES else _WMO_UNKNOWN for i in range(100)], dtype=np.int8)
+
+# One keep-alive session for all Open-Meteo hosts so repeated calls skip the TCP/TLS handshake
+_SESSION = requests.Session()
+# Transient failures (dropped connections, 429/5xx) are retried with backoff instead of surfacing as page errors
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                                       max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))))
+
+# On-disk response cache: finished archive windows never change, forecasts are served stale-while-revalidate
+CACHE_DIR = os.path.expanduser(os.environ.get("LETTA_CACHE_DIR", "")) or os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "http_cache")
+ARCHIVE_SETTLED_DAYS = 7       # archive days older than this are final (reanalysis lag)
+ARCHIVE_RECENT_TTL_S = 6 * 3600
+FORECAST_TTL_S = 3600
+# In-process layer on top of the disk cache: widget reruns skip the file read + JSON parse entirely
+MEMO_ARCHIVE_TTL_S = ARCHIVE_RECENT_TTL_S  # never outlive the disk rule for windows still being revised
+MEMO_FORECAST_TTL_S = 15 * 60
+MEMO_MAX_ENTRIES = 512
+GEOCODE_TTL_S = 7 * 86400      # place coordinates don't move
+CACHE_MAX_FILES = 2000         # response bodies kept on disk; the oldest by mtime are pruned past this
+CACHE_PRUNE_EVERY = 100        # writes between directory scans, so the cap may be overshot by at most this
+_refreshing = set(); _refresh_lock = threading.Lock()
+_writes_since_prune = CACHE_PRUNE_EVERY; _prune_lock = threading.Lock()  # first write in a process scans
+
+def _loads(raw: bytes) -> Any:
+    # orjson parses the large numeric arrays of archive payloads several times faster than stdlib json
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def _dumps(payload: Any) -> bytes:
+    return orjson.dumps(payload) if orjson is not None else json.dumps(payload).encode("utf-8")
+
+def _cache_key(url: str, params: Dict[str, Any]) -> str:
+    return hashlib.md5(f"{url}?{json.dumps(params, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+def _cache_read(key: str):
+    path = os.path.join(CACHE_DIR, key + ".json")
+    try:
+        with open(path, "rb") as f: payload = _loads(f.read())
+        return payload, time.time() - os.path.getmtime(path)
+    except (OSError, ValueError):
+        return None
+
+def _cache_write(key: str, payload: Any, validators: Optional[Dict[str, str]] = None):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = os.path.join(CACHE_DIR, f"{key}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f: f.write(_dumps(payload))
+        os.replace(tmp, os.path.join(CACHE_DIR, key + ".json"))
+        meta = os.path.join(CACHE_DIR, key + ".meta")
+        if validators:
+            with open(meta, "w") as f: json.dump(validators, f)
+        elif os.path.exists(meta): os.remove(meta)
+        _cache_prune()
+    except OSError:
+        pass
+
+def _cache_prune():
+    # TTLs only decide freshness; this bounds the directory. The scan stats every file, so it only runs once
+    # per CACHE_PRUNE_EVERY writes; trimming to 90% of the cap spaces out the deletions as well
+    global _writes_since_prune
+    with _prune_lock:
+        _writes_since_prune += 1
+        if _writes_since_prune < CACHE_PRUNE_EVERY: return
+        _writes_since_prune = 0
+    with os.scandir(CACHE_DIR) as it:
+        bodies = [(e.stat().st_mtime, e.path) for e in it if e.name.endswith(".json")]
+    if len(bodies) <= CACHE_MAX_FILES: return
+    bodies.sort()
+    for _, path in bodies[:len(bodies) - int(CACHE_MAX_FILES * 0.9)]:
+        for p in (path, path[:-len(".json")] + ".meta"):
+            try: os.remove(p)
+            except OSError: pass
+
+def _cache_validators(key: str) -> Dict[str, str]:
+    # ETag / Last-Modified of the cached body, replayed as conditional headers once the TTL runs out
+    try:
+        with open(os.path.join(CACHE_DIR, key + ".meta")) as f: v = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    headers = {}
+    if v.get("etag"): headers["If-None-Match"] = v["etag"]
+    if v.get("last_modified"): headers["If-Modified-Since"] = v["last_modified"]
+    return headers
+
+def _fetch_into_cache(key: str, url: str, params: Dict[str, Any], timeout: float, revalidate: bool = False) -> Any:
+    # Returns the fresh payload, or None when the server answered 304 and the cached body was re-stamped
+    headers = _cache_validators(key) if revalidate else {}
+    r = _SESSION.get(url, params=params, headers=headers, timeout=timeout)
+    if r.status_code == 304 and headers:
+        try: os.utime(os.path.join(CACHE_DIR, key + ".json"))
+        except OSError: pass
+        return None
+    r.raise_for_status(); payload = _loads(r.content)
+    _cache_write(key, payload, {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+                 if "ETag" in r.headers or "Last-Modified" in r.headers else None)
+    return payload
+
+def _refresh_in_background(key: str, url: str, params: Dict[str, Any], timeout: float):
+    with _refresh_lock:
+        if key in _refreshing: return
+        _refreshing.add(key)
+    def run():
+        try: _fetch_into_cache(key, url, params, timeout, revalidate=True)
+        except Exception: pass
+        finally:
+            with _refresh_lock: _refreshing.discard(key)
+    threading.Thread(target=run, daemon=True).start()
+
+def _cached_json(url: str, params: Dict[str, Any], timeout: float, ttl_s: Optional[float], stale_ok: bool = False) -> Any:
+    key = _cache_key(url, params); hit = _cache_read(key)
+    if hit is not None:
+        payload, age = hit
+        if ttl_s is None or age < ttl_s: return payload
+        if stale_ok:
+            _refresh_in_background(key, url, params, timeout); return payload
+        fresh = _fetch_into_cache(key, url, params, timeout, revalidate=True)
+        return payload if fresh is None else fresh
+    return _fetch_into_cache(key, url, params, timeout)
+
+def _archive_ttl(end: str) -> Optional[float]:
+    settled = date.fromisoformat(end) < date.today() - timedelta(days=ARCHIVE_SETTLED_DAYS)
+    return None if settled else ARCHIVE_RECENT_TTL_S
 
 def geocode_place(name: str, count: int = 5):
+    key = name.strip().lower()
+    if len(key) < 2: return []  # the geocoder answers nothing below 2 characters: skip the round-trip
+    return _geocode_remote(key, count)
+
+def place_label(r: Dict[str, Any]) -> str:
+    return f"{r['name']}, {r.get('admin1','')}, {r.get('country','')} ({r['latitude']:.3f}, {r['longitude']:.3f})"
+
+@st.cache_data(ttl=GEOCODE_TTL_S, max_entries=1024, show_spinner=False)
+def _geocode_remote(key: str, count: int) -> list:
+    # Shared across sessions and keyed on the normalized query, so "Giresun" and " giresun" are one lookup
     url = "https://geocoding-api.open-meteo.com/v1/search"
-    params = {"name": name, "count": count, "language": "en", "format": "json"}
-    r = requests.get(url, params=params, timeout=20); r.raise_for_status()
-    return r.json().get("results", [])
+    params = {"name": key, "count": count, "language": "en", "format": "json"}
+    r = _SESSION.get(url, params=params, timeout=20); r.raise_for_status()
+    return _loads(r.content).get("results", [])
 
-def fetch_openmeteo_archive(lat: float, lon: float, start: str, end: str, tz_str: str = "auto") -> Dict[str, Any]:
-    url = "https://archive-api.open-meteo.com/v1/archive"
-    hourly_vars = [
-        "temperature_2m","relative_humidity_2m","dew_point_2m","apparent_temperature",
-        "precipitation","rain","snowfall","surface_pressure","wind_speed_10m","wind_gusts_10m","wind_direction_10m"
-    ]
-    daily_vars = ["temperature_2m_max","temperature_2m_min","precipitation_sum","wind_speed_10m_max","weathercode"]
+# Hourly variables the pages actually chart/summarize; the rest are only requested on demand
+HOURLY_REQUIRED = ["temperature_2m","relative_humidity_2m","dew_point_2m","precipitation","wind_speed_10m"]
+HOURLY_OPTIONAL_ARCHIVE = ["apparent_temperature","rain","snowfall","surface_pressure","wind_gusts_10m","wind_direction_10m"]
+HOURLY_OPTIONAL_FORECAST = ["apparent_temperature","surface_pressure","wind_gusts_10m","wind_direction_10m"]
+DAILY_VARS = ["temperature_2m_max","temperature_2m_min","precipitation_sum","wind_speed_10m_max","weathercode"]
+
+def _archive_params(lat, lon, start: str, end: str, tz_str: str, extended: bool = False, hourly: bool = True) -> Dict[str, Any]:
     params = {"latitude": lat, "longitude": lon, "start_date": start, "end_date": end,
-              "hourly": ",".join(hourly_vars), "daily": ",".join(daily_vars), "timezone": tz_str}
-    r = requests.get(url, params=params, timeout=30); r.raise_for_status()
-    return r.json()
+              "daily": ",".join(DAILY_VARS), "timezone": tz_str}
+    # Daily-only callers (GDD, alerts) skip the hourly block: ~24x fewer values to download and parse
+    if hourly: params["hourly"] = ",".join(HOURLY_REQUIRED + (HOURLY_OPTIONAL_ARCHIVE if extended else []))
+    return params
+
+@st.cache_data(ttl=MEMO_ARCHIVE_TTL_S, max_entries=MEMO_MAX_ENTRIES, show_spinner=False)
+def fetch_openmeteo_archive(lat: float, lon: float, start: str, end: str, tz_str: str = "auto",
+                            extended: bool = False, hourly: bool = True) -> Dict[str, Any]:
+    url = "https://archive-api.open-meteo.com/v1/archive"
+    params = _archive_params(round(lat, 3), round(lon, 3), start, end, tz_str, extended, hourly)
+    return _cached_json(url, params, timeout=30, ttl_s=_archive_ttl(end))
 
-def fetch_openmeteo_forecast(lat: float, lon: float, days: int = 7, tz_str: str = "auto") -> Dict[str, Any]:
+@st.cache_data(ttl=MEMO_ARCHIVE_TTL_S, max_entries=MEMO_MAX_ENTRIES, show_spinner=False)
+def fetch_openmeteo_archive_batch(points: Sequence[Tuple[float, float]], start: str, end: str, tz_str: str = "auto",
+                                  extended: bool = False, hourly: bool = True) -> List[Dict[str, Any]]:
+    # Open-Meteo takes comma-separated coordinates and answers with one payload per location
+    if not points: return []
+    url = "https://archive-api.open-meteo.com/v1/archive"
+    lats = ",".join(f"{la:.4f}" for la, _ in points); lons = ",".join(f"{lo:.4f}" for _, lo in points)
+    data = _cached_json(url, _archive_params(lats, lons, start, end, tz_str, extended, hourly), timeout=60, ttl_s=_archive_ttl(end))
+    payloads = data if isinstance(data, list) else [data]
+    if len(payloads) != len(points):
+        raise ValueError(f"Expected {len(points)} locations from Open-Meteo, got {len(payloads)}")
+    return payloads
+
+@st.cache_data(ttl=MEMO_FORECAST_TTL_S, max_entries=MEMO_MAX_ENTRIES, show_spinner=False)
+def fetch_openmeteo_forecast(lat: float, lon: float, days: int = 7, tz_str: str = "auto",
+                             extended: bool = False) -> Dict[str, Any]:
     url = "https://api.open-meteo.com/v1/forecast"
-    hourly_vars = [
-        "temperature_2m","relative_humidity_2m","dew_point_2m","apparent_temperature",
-        "precipitation","surface_pressure","wind_speed_10m","wind_gusts_10m","wind_direction_10m"
-    ]
-    daily_vars = ["temperature_2m_max","temperature_2m_min","precipitation_sum","wind_speed_10m_max","weathercode"]
-    params = {"latitude": lat,"longitude": lon,"hourly": ",".join(hourly_vars),
-              "daily": ",".join(daily_vars),"forecast_days": days,"timezone": tz_str}
-    r = requests.get(url, params=params, timeout=30); r.raise_for_status()
-    return r.json()
+    hourly_vars = HOURLY_REQUIRED + (HOURLY_OPTIONAL_FORECAST if extended else [])
+    params = {"latitude": round(lat, 3),"longitude": round(lon, 3),"hourly": ",".join(hourly_vars),
+              "daily": ",".join(DAILY_VARS),"forecast_days": days,"timezone": tz_str}
+    return _cached_json(url, params, timeout=30, ttl_s=FORECAST_TTL_S, stale_ok=True)
+
+# Set to False to keep pandas' float64 defaults for precision-sensitive use
+DOWNCAST = True
+_INT_COLUMNS = ("weathercode", "wind_direction_10m")  # whole-number codes/degrees, nullable
 
+def _downcast(df: pd.DataFrame) -> pd.DataFrame:
+    # Open-Meteo values carry ~0.1 precision: float32 halves the bytes every later groupby/mean touches
+    if not DOWNCAST: return df
+    types = {c: "float32" for c in df.columns if df[c].dtype == np.float64}
+    types.update({c: "Int16" for c in _INT_COLUMNS if c in df.columns})
+    return df.astype(types) if types else df
+
+def _column(name: str, values: list):
+    # Parse JSON number lists straight into float32 rather than float64 followed by a downcast copy
+    if DOWNCAST and name not in _INT_COLUMNS:
+        try: return np.asarray(values, dtype=np.float32)
+        except (TypeError, ValueError): return values  # non-numeric variables (e.g. ISO strings)
+    return values
+
+def _time_index(times: list, freq: str, fmt: str) -> pd.DatetimeIndex:
+    # Open-Meteo returns a regular grid: build it from the endpoints instead of parsing every string,
+    # falling back to a full parse when the grid disagrees (DST repeats/gaps in local-time output).
+    # A gap and a repeat cancel out in the count, shifting every stamp between them by an hour, so
+    # evenly spaced stamps are also checked; the shifted stretch spans months, far wider than the spacing
+    if len(times) > 1:
+        idx = pd.date_range(times[0], times[-1], freq=freq)
+        if len(idx) == len(times):
+            probe = np.unique(np.linspace(0, len(times) - 1, 64).astype(np.int64))
+            if (idx[probe].strftime(fmt) == np.asarray(times, dtype=object)[probe]).all(): return idx
+    try: return pd.to_datetime(times, format=fmt, cache=True)  # fixed layout: no per-string format inference
+    except ValueError: return pd.to_datetime(times, cache=True)
+
+def _payload_fingerprint(payload: dict) -> str:
+    # Identifies a response without hashing its arrays: location, server stamp and each block's time axis
+    head = [payload.get(k) for k in ("latitude", "longitude", "elevation", "generationtime_ms", "utc_offset_seconds")]
+    axes = [(b, sorted(payload[b]), payload[b].get("time", [])[:1], payload[b].get("time", [])[-1:], len(payload[b].get("time", [])))
+            for b in ("hourly", "daily") if isinstance(payload.get(b), dict)]
+    return json.dumps([head, axes], default=str)
+
+# Frames are rebuilt from the same payload on every Fetch click; parse each response once
+@st.cache_data(max_entries=64, show_spinner=False, hash_funcs={dict: _payload_fingerprint})
 def hourly_to_dataframe(payload: dict) -> pd.DataFrame:
     if "hourly" not in payload: return pd.DataFrame()
-    h = payload["hourly"]; times = pd.to_datetime(h.get("time", []))
-    df = pd.DataFrame({"time": times})
-    for k, v in h.items():
-        if k != "time": df[k] = v
-    return df.set_index("time")
+    h = payload["hourly"]; times = _time_index(h.get("time", []), "h", "%Y-%m-%dT%H:%M")
+    df = pd.DataFrame({k: _column(k, v) for k, v in h.items() if k != "time"}, index=times.rename("time"))
+    return _downcast(df)
+
+# Short names the pages and models use for the daily API block
+API_DAILY_RENAME = {"temperature_2m_min": "t_min_api", "temperature_2m_max": "t_max_api",
+                    "precipitation_sum": "precip_sum_api", "wind_speed_10m_max": "wind_max_api"}
 
-def daily_to_dataframe(payload: dict) -> pd.DataFrame:
+@st.cache_data(max_entries=64, show_spinner=False, hash_funcs={dict: _payload_fingerprint})
+def daily_to_dataframe(payload: dict, renamed: bool = False) -> pd.DataFrame:
+    # renamed=True emits API_DAILY_RENAME names at construction instead of a .rename() copy afterwards
     if "daily" not in payload: return pd.DataFrame()
-    d = payload["daily"]; times = pd.to_datetime(d.get("time", []))
-    df = pd.DataFrame({"date": times.date})
-    for k, v in d.items():
-        if k != "time": df[k] = v
-    df = df.set_index(pd.to_datetime(df["date"])).drop(columns=["date"])
-    return df
+    names = API_DAILY_RENAME if renamed else {}
+    d = payload["daily"]; times = _time_index(d.get("time", []), "D", "%Y-%m-%d")
+    df = pd.DataFrame({names.get(k, k): _column(k, v) for k, v in d.items() if k != "time"}, index=times.normalize().rename("date"))
+    return _downcast(df)
+
+_DAILY_FROM_HOURLY = [
+    ("temperature_2m", "mean", "t_mean"), ("temperature_2m", "min", "t_min_hourly"), ("temperature_2m", "max", "t_max_hourly"),
+    ("relative_humidity_2m", "mean", "rh_mean"), ("dew_point_2m", "mean", "dewpoint_mean"),
+    ("precipitation", "sum", "precip_sum_hourly"), ("wind_speed_10m", "max", "wind_max_hourly"),
+]
 
 def summarize_daily_from_hourly(h: pd.DataFrame) -> pd.DataFrame:
     if h.empty: return pd.DataFrame()
-    g = h.groupby(h.index.date)
-    daily = pd.DataFrame({
-        "t_mean": g["temperature_2m"].mean(),
-        "t_min_hourly": g["temperature_2m"].min(),
-        "t_max_hourly": g["temperature_2m"].max(),
-        "rh_mean": g["relative_humidity_2m"].mean(),
-        "dewpoint_mean": g["dew_point_2m"].mean(),
-        "precip_sum_hourly": g["precipitation"].sum(),
-        "wind_max_hourly": g["wind_speed_10m"].max()
-    })
-    daily.index = pd.to_datetime(daily.index)
-    return daily
+    # One resample pass on the native DatetimeIndex instead of grouping on Python date objects
+    spec = [(c, f, name) for c, f, name in _DAILY_FROM_HOURLY if c in h.columns]
+    return h.resample("D").agg(**{name: (c, f) for c, f, name in spec})
+
+def join_daily_columns(api: pd.DataFrame, derived: pd.DataFrame) -> pd.DataFrame:
+    # API daily block and hourly-derived summary normally share one daily grid: place the columns side by side
+    # and only fall back to the outer join (sorted union) when the ranges differ
+    if api.index.equals(derived.index): return pd.concat([api, derived], axis=1)
+    return api.join(derived, how="outer")
 
 def add_weather_desc(df: pd.DataFrame) -> pd.DataFrame:
     if "weathercode" in df.columns:
-        df = df.copy(); df["weather_desc"] = df["weathercode"].map(WMO_CODES).fillna("Unknown")
+        codes = df["weathercode"].to_numpy(dtype=np.int16, na_value=-1); known = (codes >= 0) & (codes < 100)
+        cat = np.where(known, _WMO_LUT[np.clip(codes, 0, 99)], _WMO_UNKNOWN)
+        df = df.copy(); df["weather_desc"] = pd.Categorical.from_codes(cat, categories=_WMO_CATEGORIES)
     return df
 
+def sunny_mask(weathercode: pd.Series, include_mainly_clear: bool = True) -> np.ndarray:
+    # Sunny codes as bits of one word (bit k set = code k counts); a shift-and-test per day replaces isin.
+    # Missing/out-of-range codes are pointed at bit 63, which is never set.
+    bits = np.uint64(0b11 if include_mainly_clear else 0b01)
+    wc = weathercode.to_numpy(dtype=np.int64, na_value=-1)
+    wc = np.where((wc >= 0) & (wc < 64), wc, 63).astype(np.uint64)
+    return ((bits >> wc) & np.uint64(1)).astype(bool)
+
+def _align_points(dfs: List[pd.DataFrame]):
+    # Same date range per point usually means identical time grids: skip the union and reindex entirely
+    if all(d.index.equals(dfs[0].index) for d in dfs[1:]):
+        return dfs[0].index, list(dfs)
+    idx = reduce(lambda a, b: a.union(b), (d.index for d in dfs))
+    return idx, [d.reindex(idx) for d in dfs]
+
+def _numeric_columns(dfs: List[pd.DataFrame], exclude=()) -> List[str]:
+    cols = []
+    for d in dfs:
+        cols += [c for c in d.columns if c not in cols and c not in exclude and pd.api.types.is_numeric_dtype(d[c])]
+    return cols
+
+def _nanmean_points(aligned: List[pd.DataFrame], cols: List[str]) -> np.ndarray:
+    # (points, time, columns) tensor reduced over the point axis, ignoring gaps; each frame is written
+    # straight into the preallocated buffer rather than copied into a temporary first
+    arr = np.full((len(aligned), len(aligned[0].index), len(cols)), np.nan, dtype=np.float32)
+    for i, d in enumerate(aligned):
+        pos = [j for j, c in enumerate(cols) if c in d.columns]
+        arr[i][:, pos] = d[[cols[j] for j in pos]].to_numpy(dtype=np.float32, na_value=np.nan)
+    return _nanmean_kernel(arr)
+
+def _mean_points(aligned: List[pd.DataFrame], cols: List[str]) -> np.ndarray:
+    # A one-point "average" is the point itself: same float64 layout as the reduction, without the stack
+    if len(aligned) == 1: return aligned[0][cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    return _nanmean_points(aligned, cols)
+
+def _nanmean_axis0_np(arr):
+    valid = ~np.isnan(arr); n = valid.sum(axis=0)
+    total = np.where(valid, arr, 0.0).sum(axis=0, dtype=np.float64)
+    return np.where(n > 0, total / np.maximum(n, 1), np.nan)
+
+def _nanmean_axis0_loop(arr):
+    # Gap check and accumulation fused into one pass, time steps split across threads
+    P, T, C = arr.shape; out = np.empty((T, C), dtype=np.float64)
+    for t in prange(T):
+        for c in range(C):
+            s = 0.0; n = 0
+            for p in range(P):
+                v = arr[p, t, c]
+                if v == v: s += v; n += 1
+            out[t, c] = s / n if n > 0 else np.nan
+    return out
+
+# fastmath stays off: it would fold away the v == v gap test
+_nanmean_kernel = njit(cache=True, parallel=True)(_nanmean_axis0_loop) if njit is not None else _nanmean_axis0_np
+
+def _mode_codes(codes: np.ndarray) -> np.ndarray:
+    # Per-row majority vote over small non-negative integer codes (-1 = missing); ties go to the lowest code
+    rows = codes.shape[0]; width = int(max(codes.max(initial=-1), 0)) + 2
+    counts = np.bincount((codes + 1 + np.arange(rows)[:, None] * width).ravel(), minlength=rows * width).reshape(rows, width)
+    counts[:, 0] = 0
+    return np.where(counts.any(axis=1), counts.argmax(axis=1) - 1, np.nan)
+
 def aggregate_daily_across_points(dfs: List[pd.DataFrame]) -> pd.DataFrame:
     if not dfs: return pd.DataFrame()
-    aligned = [d.copy() for d in dfs]
-    idx = sorted(set().union(*[d.index for d in aligned]))
-    aligned = [d.reindex(idx) for d in aligned]
-    stacked = pd.concat(aligned, axis=1, keys=range(len(aligned)))
-    numeric_cols = [c for c in aligned[0].columns if c != "weathercode"]
-    num = stacked.loc[:, stacked.columns.get_level_values(1).isin(numeric_cols)]
-    agg_num = num.groupby(level=1, axis=1).mean(numeric_only=True)
-    if "weathercode" in aligned[0].columns:
-        wc = stacked.xs("weathercode", axis=1, level=1); wc_mode = wc.mode(axis=1)
-        agg = agg_num.copy(); agg["weathercode"] = wc_mode.iloc[:,0] if not wc_mode.empty else np.nan
-    else:
-        agg = agg_num
+    idx, aligned = _align_points(dfs)
+    cols = _numeric_columns(aligned, exclude=("weathercode",))
+    agg = pd.DataFrame(_mean_points(aligned, cols), index=idx, columns=cols)
+    if any("weathercode" in d.columns for d in aligned):
+        wc = np.stack([d["weathercode"].to_numpy(dtype=np.float64, na_value=np.nan) if "weathercode" in d.columns
+                       else np.full(len(idx), np.nan) for d in aligned], axis=1)
+        agg["weathercode"] = _mode_codes(np.where(np.isnan(wc), -1, wc).astype(np.int64))
     return agg
 
 def aggregate_hourly_across_points(dfs: List[pd.DataFrame]) -> pd.DataFrame:
     if not dfs: return pd.DataFrame()
-    aligned = [d.copy() for d in dfs]
-    idx = sorted(set().union(*[d.index for d in aligned]))
-    aligned = [d.reindex(idx) for d in aligned]
-    stacked = pd.concat(aligned, axis=1, keys=range(len(aligned)))
-    return stacked.groupby(level=1, axis=1).mean(numeric_only=True)
+    idx, aligned = _align_points(dfs)
+    cols = _numeric_columns(aligned)
+    return pd.DataFrame(_mean_points(aligned, cols), index=idx, columns=cols)
+
+def _gdd_np(tmin, tmax, base, cap):
+    return np.maximum(0.5 * (tmin + np.minimum(tmax, cap)) - base, 0.0)
+
+def _gdd_loop(tmin, tmax, base, cap):
+    # One fused pass per day; comparisons are written so NaN days stay NaN like the pandas clip did
+    out = np.empty_like(tmin)
+    for i in range(tmin.shape[0]):
+        tx = tmax[i]
+        if tx > cap: tx = cap
+        v = 0.5 * (tmin[i] + tx) - base
+        out[i] = 0.0 if v < 0.0 else v
+    return out
+
+# No fastmath here: it would let the compiler assume away the NaN days
+_gdd_kernel = njit(cache=True)(_gdd_loop) if njit is not None else _gdd_np
 
 def compute_gdd(daily_df: pd.DataFrame, base_c: float = 10.0, cap_c: Optional[float] = None) -> pd.Series:
     tmin = daily_df.get("t_min_api", daily_df.get("temperature_2m_min"))
     tmax = daily_df.get("t_max_api", daily_df.get("temperature_2m_max"))
     if tmin is None or tmax is None: return pd.Series(dtype=float)
-    tmin = tmin.copy(); tmax = tmax.copy()
-    if cap_c is not None: tmax = tmax.clip(upper=cap_c)
-    tmean = (tmin + tmax) / 2.0
-    gdd = (tmean - base_c).clip(lower=0.0); gdd.name = "GDD"
-    return gdd
+    gdd = _gdd_kernel(tmin.to_numpy(dtype=np.float64, na_value=np.nan), tmax.to_numpy(dtype=np.float64, na_value=np.nan),
+                      float(base_c), np.inf if cap_c is None else float(cap_c))
+    return pd.Series(gdd, index=daily_df.index, name="GDD")
 
 def monthly_from_daily(daily_df: pd.DataFrame) -> pd.DataFrame:
     if daily_df is None or daily_df.empty: return pd.DataFrame()
-    df = daily_df.copy(); df.index = pd.to_datetime(df.index); df["month"] = df.index.to_period("M").astype(str)
+    df = daily_df
     tmin = df.get("t_min_api", df.get("temperature_2m_min"))
     tmax = df.get("t_max_api", df.get("temperature_2m_max"))
     rh   = df.get("rh_mean")
     dpt  = df.get("dewpoint_mean")
     pr   = df.get("precip_sum_api", df.get("precipitation_sum", pd.Series(index=df.index, dtype=float)))
     wc   = df.get("weathercode")
-    sunny = df.get("sunny") if "sunny" in df.columns else (wc.isin([0,1]) if wc is not None else None)
+    sunny = df.get("sunny") if "sunny" in df.columns else (sunny_mask(wc) if wc is not None else None)
 
-    agg = pd.DataFrame(index=sorted(df["month"].unique()))
-    if tmin is not None: df["_tmin"]=tmin; agg["tmin_mean"]=df.groupby("month")["_tmin"].mean()
-    if tmax is not None: df["_tmax"]=tmax; agg["tmax_mean"]=df.groupby("month")["_tmax"].mean()
-    if rh is not None:   df["_rh"]=rh;     agg["rh_mean"]=df.groupby("month")["_rh"].mean()
-    if dpt is not None:  df["_dew"]=dpt;   agg["dew_mean"]=df.groupby("month")["_dew"].mean()
+    # All means and day-count flags are reduced over one month coding: a bincount per column, no groupby
+    cols, how = {}, {}
+    def put(name, values, f): cols[name] = np.asarray(values); how[name] = f
+    if tmin is not None: put("tmin_mean", tmin, "mean")
+    if tmax is not None: put("tmax_mean", tmax, "mean")
+    if rh is not None:   put("rh_mean", rh, "mean")
+    if dpt is not None:  put("dew_mean", dpt, "mean")
     if pr is not None:
-        df["_pr"]=pr.fillna(0.0)
-        agg["precip_total"]=df.groupby("month")["_pr"].sum()
-        df["_rain_flag"]=(df["_pr"]>1.0).astype(int); df["_dry_flag"]=(df["_pr"]<1.0).astype(int)
-        agg["rainy_days"]=df.groupby("month")["_rain_flag"].sum()
-        agg["dry_days"]=df.groupby("month")["_dry_flag"].sum()
-    if sunny is not None:
-        df["_sunny_flag"]=sunny.astype(int)
-        agg["sunny_days"]=df.groupby("month")["_sunny_flag"].sum()
+        p = pr.fillna(0.0).to_numpy()
+        put("precip_total", p, "sum"); put("rainy_days", p > 1.0, "sum"); put("dry_days", p < 1.0, "sum")
+    if sunny is not None: put("sunny_days", sunny.astype(int), "sum")
     if tmax is not None:
-        df["_heat32"]=(df["_tmax"]>=32.0).astype(int); df["_heat35"]=(df["_tmax"]>=35.0).astype(int)
-        agg["heat_days_32C"]=df.groupby("month")["_heat32"].sum()
-        agg["heat_days_35C"]=df.groupby("month")["_heat35"].sum()
+        t = tmax.to_numpy(dtype=np.float64, na_value=np.nan)
+        put("heat_days_32C", t >= 32.0, "sum"); put("heat_days_35C", t >= 35.0, "sum")
     if tmin is not None:
-        df["_frost0"]=(df["_tmin"]<=0.0).astype(int); df["_frostm2"]=(df["_tmin"]<=-2.0).astype(int)
-        agg["frost_days_0C"]=df.groupby("month")["_frost0"].sum()
-        agg["frost_days_-2C"]=df.groupby("month")["_frostm2"].sum()
-    return agg
+        t = tmin.to_numpy(dtype=np.float64, na_value=np.nan)
+        put("frost_days_0C", t <= 0.0, "sum"); put("frost_days_-2C", t <= -2.0, "sum")
+    month = pd.DatetimeIndex(df.index).to_period("M")
+    if not cols: return pd.DataFrame(index=month.unique().astype(str))
+    codes, months = pd.factorize(month, sort=True); n = len(months)
+    out = {}
+    for name, v in cols.items():
+        x = v.astype(np.float64); ok = (codes >= 0) & ~np.isnan(x)  # NaN days are skipped like groupby does
+        total = np.bincount(codes[ok], weights=x[ok], minlength=n)
+        if how[name] == "mean":
+            with np.errstate(invalid="ignore"): out[name] = total / np.bincount(codes[ok], minlength=n)
+        else:
+            out[name] = total.astype(np.int64) if v.dtype.kind in "biu" else total
+    return pd.DataFrame(out, index=pd.Index(months.astype(str)))
 
 def weekly_precip_from_daily(daily_df: pd.DataFrame, week_label: str = "W-MON") -> pd.DataFrame:
     if daily_df is None or daily_df.empty: return pd.DataFrame()
-    df = daily_df.copy(); df.index = pd.to_datetime(df.index)
-    pr = df.get("precip_sum_api", df.get("precipitation_sum"))
+    pr = daily_df.get("precip_sum_api", daily_df.get("precipitation_sum"))
     if pr is None: return pd.DataFrame()
+    # Frames from daily_to_dataframe already carry a DatetimeIndex: only parse (and copy) anything else
+    if not isinstance(pr.index, pd.DatetimeIndex): pr = pr.set_axis(pd.to_datetime(pr.index))
     wk = pr.resample(week_label).sum().to_frame("precip_week_sum")
-    wk["week_start"] = wk.index.to_period("W-MON").start_time.date
-    wk["week_end"] = wk.index.to_period("W-MON").end_time.date
+    weeks = wk.index.to_period("W-MON")
+    wk["week_start"] = weeks.start_time.date
+    wk["week_end"] = weeks.end_time.date
     wk["month"] = wk.index.to_period("M").astype(str)
     return wk
 
 def count_heat_days_in_month(daily_df: pd.DataFrame, month:int, threshold_c: float = 35.0) -> int:
     if daily_df is None or daily_df.empty: return 0
-    df = daily_df.copy(); df.index = pd.to_datetime(df.index)
-    tmax = df.get("t_max_api", df.get("temperature_2m_max"))
+    tmax = daily_df.get("t_max_api", daily_df.get("temperature_2m_max"))
     if tmax is None: return 0
-    sel = df[df.index.month == month]
-    return int((sel[tmax.name] >= threshold_c).sum())
+    in_month = pd.DatetimeIndex(daily_df.index).month == month
+    return int((tmax.to_numpy(dtype=np.float64, na_value=np.nan)[in_month] >= threshold_c).sum())
 
 def drought_proxy_flags(monthly_df: pd.DataFrame) -> pd.Series:
     if monthly_df is None or monthly_df.empty: return pd.Series(dtype=bool)
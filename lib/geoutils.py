@@ -1,6 +1,19 @@
 import os, json
-from typing import Dict, Tuple, List
+from typing import Dict
 import numpy as np
+import streamlit as st
+
+try:
+    from numba import njit
+except ImportError:  # optional accelerator
+    njit = None
+
+try:
+    import shapely
+    from shapely.geometry import shape
+    if not hasattr(shapely, "intersects_xy"): shapely = None  # 1.x imports fine but lacks the vectorized *_xy API
+except ImportError:  # optional accelerator
+    shapely = None
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 ORCH_FILE = os.path.join(DATA_DIR, "orchards.json")
@@ -21,46 +34,100 @@ def parse_polygon_from_output(out: dict):
             return last["geometry"]
     return None
 
-def polygon_bounds(geom: dict):
-    coords = geom["coordinates"][0]
-    lons = [c[0] for c in coords]; lats = [c[1] for c in coords]
-    return min(lats), min(lons), max(lats), max(lons)
+def _polygon_bounds(geom: dict):
+    ring = np.asarray(geom["coordinates"][0], dtype=np.float64)[:, :2]
+    (min_lon, min_lat), (max_lon, max_lat) = ring.min(axis=0), ring.max(axis=0)
+    return float(min_lat), float(min_lon), float(max_lat), float(max_lon)
 
-def sample_points_in_polygon(geom: dict, max_points: int = 9):
-    def point_in_poly(lat, lon, poly):
-        x = lon; y = lat; inside = False; n = len(poly)
+def _points_in_poly_np(lats, lons, poly_lat, poly_lon):
+    # Ray casting over the whole grid at once: one vectorized crossing test per edge (vertex -> next vertex)
+    inside = np.zeros(lats.shape, dtype=bool)
+    for y1, x1, y2, x2 in zip(poly_lat, poly_lon, np.roll(poly_lat, -1), np.roll(poly_lon, -1)):
+        inside ^= ((y1 > lats) != (y2 > lats)) & (lons < (x2 - x1) * (lats - y1) / (y2 - y1 + 1e-12) + x1)
+    return inside
+
+def _points_in_poly_loop(lats, lons, poly_lat, poly_lon):
+    out = np.zeros(lats.shape[0], dtype=np.bool_); n = poly_lat.shape[0]
+    for k in range(lats.shape[0]):
+        y = lats[k]; x = lons[k]; inside = False; j = n - 1
         for i in range(n):
-            x1, y1 = poly[i][1], poly[i][0]
-            x2, y2 = poly[(i+1)%n][1], poly[(i+1)%n][0]
-            cond = ((y1 > y) != (y2 > y)) and (x < (x2 - x1) * (y - y1) / (y2 - y1 + 1e-12) + x1)
-            if cond: inside = not inside
-        return inside
-    coords = geom["coordinates"][0]; poly = [(c[1], c[0]) for c in coords]
-    min_lat, min_lon, max_lat, max_lon = polygon_bounds(geom)
-    n = int(np.ceil(np.sqrt(max_points)))
-    lat_grid = np.linspace(min_lat, max_lat, max(2, n))
-    lon_grid = np.linspace(min_lon, max_lon, max(2, n))
-    pts = []
-    for la in lat_grid:
-        for lo in lon_grid:
-            if point_in_poly(la, lo, poly): pts.append((la, lo))
+            y1 = poly_lat[j]; x1 = poly_lon[j]; y2 = poly_lat[i]; x2 = poly_lon[i]
+            if ((y1 > y) != (y2 > y)) and (x < (x2 - x1) * (y - y1) / (y2 - y1 + 1e-12) + x1):
+                inside = not inside
+            j = i
+        out[k] = inside
+    return out
+
+# Compiled scalar kernel when numba is installed (cache=True persists it across restarts), NumPy otherwise
+_pip_kernel = njit(cache=True, fastmath=True)(_points_in_poly_loop) if njit is not None else _points_in_poly_np
+
+def points_in_poly(lats, lons, poly_lat, poly_lon):
+    # Reject candidates outside the polygon's bounding box before walking the edges
+    inside = np.zeros(lats.shape, dtype=bool)
+    cand = np.flatnonzero((lats >= poly_lat.min()) & (lats <= poly_lat.max())
+                          & (lons >= poly_lon.min()) & (lons <= poly_lon.max()))
+    if cand.size:
+        inside[cand] = _pip_kernel(lats[cand], lons[cand], poly_lat, poly_lon)
+    return inside
+
+def _sample_points(geom: dict, max_points: int):
+    poly = np.asarray(geom["coordinates"][0], dtype=np.float64)[:, 1::-1]  # GeoJSON lon/lat -> lat/lon
+    poly_lat = np.ascontiguousarray(poly[:, 0]); poly_lon = np.ascontiguousarray(poly[:, 1])
+    (min_lat, min_lon), (max_lat, max_lon) = poly.min(axis=0), poly.max(axis=0)  # ring already in hand
+    # 2x oversampled grid: a bare sqrt(max_points) grid over the bbox loses most nodes to edges and concave parts,
+    # leaving too few inside; the even thinning below trims any surplus back to max_points
+    n = max(2, int(np.ceil(np.sqrt(2 * max_points))))
+    while True:
+        xx, yy = np.meshgrid(np.linspace(min_lon, max_lon, n), np.linspace(min_lat, max_lat, n)); xx = xx.ravel(); yy = yy.ravel()
+        if shapely is not None:
+            # GEOS vectorized test; also honours interior rings (holes). intersects, not contains, so nodes on the
+            # boundary (the bbox grid's outer ring, for a drawn rectangle) count like they do in the ray caster
+            inside = shapely.intersects_xy(shape(geom), xx, yy)
+        else:
+            inside = points_in_poly(yy, xx, poly_lat, poly_lon)
+        # Thin or slanted shapes (triangles, slivers) can still come up short: densify, up to a 64x64 grid
+        if inside.sum() >= max_points or n >= 64: break
+        n = min(2 * n, 64)
+    pts = list(zip(yy[inside].tolist(), xx[inside].tolist()))
     if not pts:
-        la = float(np.mean([p[0] for p in poly])); lo = float(np.mean([p[1] for p in poly])); pts = [(la, lo)]
+        pts = [(float(np.mean(poly_lat)), float(np.mean(poly_lon)))]
     if len(pts) > max_points:
         idx = np.linspace(0, len(pts)-1, max_points).astype(int).tolist(); pts = [pts[i] for i in idx]
     return pts
 
-def load_orchards() -> Dict[str, dict]:
-    ensure_data_dir()
-    if not os.path.exists(ORCH_FILE): return {}
+# The drawn geometry rarely changes between reruns, so memoize on its canonical JSON
+@st.cache_data(show_spinner=False)
+def _polygon_bounds_cached(geom_json: str):
+    return _polygon_bounds(json.loads(geom_json))
+
+@st.cache_data(show_spinner=False)
+def _sample_points_cached(geom_json: str, max_points: int):
+    return _sample_points(json.loads(geom_json), max_points)
+
+def polygon_bounds(geom: dict):
+    return _polygon_bounds_cached(json.dumps(geom, sort_keys=True))
+
+def sample_points_in_polygon(geom: dict, max_points: int = 9):
+    return _sample_points_cached(json.dumps(geom, sort_keys=True), int(max_points))
+
+# Pages reload the fields file on every rerun; keyed on its mtime, so a write (or an outside edit) invalidates it
+@st.cache_data(max_entries=4, show_spinner=False)
+def _load_orchards_cached(mtime_ns: int) -> Dict[str, dict]:
     with open(ORCH_FILE, "r", encoding="utf-8") as f:
         try: return json.load(f)
         except Exception: return {}
 
+def load_orchards() -> Dict[str, dict]:
+    ensure_data_dir()
+    try: mtime_ns = os.stat(ORCH_FILE).st_mtime_ns
+    except OSError: return {}
+    return _load_orchards_cached(mtime_ns)
+
 def save_orchards(data: Dict[str, dict]):
     ensure_data_dir()
     with open(ORCH_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    _load_orchards_cached.clear()
 
 def add_orchard(name: str, geom: dict):
     data = load_orchards(); data[name] = geom; save_orchards(data)
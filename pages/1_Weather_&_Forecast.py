@@ -1,16 +1,28 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
+import altair as alt
+from concurrent.futures import ThreadPoolExecutor
 
 from lib.data_sources import (
-    geocode_place, fetch_openmeteo_archive, fetch_openmeteo_forecast,
-    hourly_to_dataframe, daily_to_dataframe, summarize_daily_from_hourly,
-    add_weather_desc, aggregate_daily_across_points, aggregate_hourly_across_points
+    geocode_place, place_label, fetch_openmeteo_archive, fetch_openmeteo_forecast,
+    hourly_to_dataframe, daily_to_dataframe, summarize_daily_from_hourly, join_daily_columns,
+    add_weather_desc, sunny_mask, aggregate_daily_across_points, aggregate_hourly_across_points, fetch_openmeteo_archive_batch
 )
 from lib.geoutils import parse_polygon_from_output, polygon_bounds, sample_points_in_polygon
 
 st.title("🌦️ Weather & Forecast")
 
+def chart(df: pd.DataFrame, col: str, height: int = 220, bar: bool = False):
+    # Two-column source + explicit types: skips line_chart's melt/type inference and ships only the plotted column
+    src = pd.DataFrame({"t": df.index, col: df[col].to_numpy()})
+    c = alt.Chart(src).encode(x=alt.X("t:T", title=None), y=alt.Y(f"{col}:Q", title=col), tooltip=["t:T", f"{col}:Q"])
+    st.altair_chart((c.mark_bar() if bar else c.mark_line()).properties(height=height), use_container_width=True)
+
+@st.cache_data(show_spinner=False)
+def daily_from_hourly(lat: float, lon: float, start: str, end: str, tz: str, extended: bool) -> pd.DataFrame:
+    # The payload is a memo hit right after the main fetch; keyed so toggling doesn't rescan
+    return summarize_daily_from_hourly(hourly_to_dataframe(fetch_openmeteo_archive(lat, lon, start, end, tz, extended, hourly=True)))
+
 with st.sidebar:
     st.header("Location")
     mode = st.radio("Select by:", ["Place name", "Latitude/Longitude", "Pick on Map", "Draw Area (Polygon)"])
@@ -20,9 +32,12 @@ with st.sidebar:
         q = st.text_input("City/Town/Region name", value="Giresun")
         results = geocode_place(q) if q else []
         if results:
-            labels = [f"{r['name']}, {r.get('admin1','')}, {r.get('country','')} ({r['latitude']:.3f}, {r['longitude']:.3f})" for r in results]
-            idx = st.selectbox("Pick a location", range(len(results)), format_func=lambda i: labels[i])
-            sel = results[idx]
+            # Labels are formatted only for the options the selectbox renders; a lone match needs no picker
+            if len(results) == 1:
+                sel = results[0]; st.caption(place_label(sel))
+            else:
+                idx = st.selectbox("Pick a location", range(len(results)), format_func=lambda i: place_label(results[i]))
+                sel = results[idx]
             lat, lon = sel["latitude"], sel["longitude"]
         else:
             lat, lon = None, None
@@ -44,6 +59,12 @@ with st.sidebar:
     show_fc = st.checkbox("Show forecast (next N days)", value=True)
     fc_days = st.slider("Forecast days", 3, 14, 7, 1)
 
+    st.header("Variables")
+    extended_vars = st.toggle("Include extended variables", value=False,
+                              help="Also download apparent temperature, rain/snow, pressure, gusts and wind direction.")
+    st.toggle("Daily humidity & dew point (from hourly)", value=False, key="show_hourly_derived",
+              help="Point mode: summarize the hourly series into daily means. Area mode always does.")
+
     st.header("Sunny Days")
     include_mainly_clear = st.toggle("Count 'Mainly clear' as sunny", value=True)
 
@@ -112,66 +133,60 @@ if fetch:
         st.write(f"Sampling **{len(sample_pts)}** points inside area for aggregation.")
         daily_list, hourly_list = [], []
         with st.spinner("Downloading historical data for sampled points..."):
-            for (la, lo) in sample_pts:
-                try:
-                    hist = fetch_openmeteo_archive(la, lo, start_date.isoformat(), end_date.isoformat(), tz_str)
-                except Exception as e:
-                    st.error(f"Archive fetch failed at ({la:.4f},{lo:.4f}): {e}")
-                    st.stop()
+            # Archive batch and the area forecast (first sample point) go out together
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                fut_hist = ex.submit(fetch_openmeteo_archive_batch, sample_pts, start_date.isoformat(), end_date.isoformat(), tz_str, extended_vars)
+                fut_fc = ex.submit(fetch_openmeteo_forecast, *sample_pts[0], days=int(fc_days), tz_str=tz_str, extended=extended_vars) if show_fc and sample_pts else None
+            try:
+                payloads = fut_hist.result()
+            except Exception as e:
+                st.error(f"Archive fetch failed for {len(sample_pts)} sampled points: {e}")
+                st.stop()
+            for hist in payloads:
                 h = hourly_to_dataframe(hist)
-                d_api = daily_to_dataframe(hist).rename(columns={
-                    "temperature_2m_min": "t_min_api",
-                    "temperature_2m_max": "t_max_api",
-                    "precipitation_sum": "precip_sum_api",
-                    "wind_speed_10m_max": "wind_max_api",
-                })
+                d_api = daily_to_dataframe(hist, renamed=True)
                 d_from_h = summarize_daily_from_hourly(h)
-                d = d_api.join(d_from_h, how="outer").sort_index()
+                d = join_daily_columns(d_api, d_from_h)
                 daily_list.append(d); hourly_list.append(h)
-        from lib.data_sources import aggregate_daily_across_points, aggregate_hourly_across_points
         ddf = aggregate_daily_across_points(daily_list)
         hdf_mean = aggregate_hourly_across_points(hourly_list)
 
         if "weathercode" in ddf.columns:
-            sunny_codes = [0, 1] if include_mainly_clear else [0]
-            ddf["sunny"] = ddf["weathercode"].isin(sunny_codes)
+            ddf["sunny"] = sunny_mask(ddf["weathercode"], include_mainly_clear)
         ddf = add_weather_desc(ddf)
 
         st.subheader("Historical — Area Aggregate")
         st.dataframe(ddf)
+        # Charts plot NaN as gaps; only the precip bars want zeros, filled once in place
+        if "precip_sum_api" in ddf.columns: ddf["precip_sum_api"] = ddf["precip_sum_api"].fillna(0)
 
         st.markdown("**Daily Temperature (Min / Max)**")
-        if "t_min_api" in ddf.columns: st.line_chart(ddf[["t_min_api"]].dropna(), height=220)
-        if "t_max_api" in ddf.columns: st.line_chart(ddf[["t_max_api"]].dropna(), height=220)
+        if "t_min_api" in ddf.columns: chart(ddf, "t_min_api", 220)
+        if "t_max_api" in ddf.columns: chart(ddf, "t_max_api", 220)
         if "rh_mean" in ddf.columns:
-            st.markdown("**Daily Humidity Mean (%)**"); st.line_chart(ddf[["rh_mean"]].dropna(), height=220)
+            st.markdown("**Daily Humidity Mean (%)**"); chart(ddf, "rh_mean", 220)
         if "dewpoint_mean" in ddf.columns:
-            st.markdown("**Daily Dew Point Mean (°C)**"); st.line_chart(ddf[["dewpoint_mean"]].dropna(), height=220)
+            st.markdown("**Daily Dew Point Mean (°C)**"); chart(ddf, "dewpoint_mean", 220)
         if "precip_sum_api" in ddf.columns:
-            st.markdown("**Daily Precipitation (mm)**"); st.bar_chart(ddf[["precip_sum_api"]].fillna(0), height=220)
+            st.markdown("**Daily Precipitation (mm)**"); chart(ddf, "precip_sum_api", 220, bar=True)
         if "wind_max_api" in ddf.columns:
-            st.markdown("**Daily Max Wind (m/s)**"); st.line_chart(ddf[["wind_max_api"]].dropna(), height=220)
+            st.markdown("**Daily Max Wind (m/s)**"); chart(ddf, "wind_max_api", 220)
 
         # Forecast for area (proxy: first sample point)
-        if show_fc and sample_pts:
+        if fut_fc is not None:
             try:
-                la0, lo0 = sample_pts[0]
-                fc = fetch_openmeteo_forecast(la0, lo0, days=int(fc_days), tz_str=tz_str)
-                ddf_fc = daily_to_dataframe(fc).rename(columns={
-                    "temperature_2m_min": "t_min_api",
-                    "temperature_2m_max": "t_max_api",
-                    "precipitation_sum": "precip_sum_api",
-                    "wind_speed_10m_max": "wind_max_api",
-                })
+                fc = fut_fc.result()
+                ddf_fc = daily_to_dataframe(fc, renamed=True)
                 st.markdown("---"); st.subheader(f"Forecast (area proxy, next {fc_days} days)")
                 if not ddf_fc.empty:
                     st.dataframe(ddf_fc)
+                    if "precip_sum_api" in ddf_fc.columns: ddf_fc["precip_sum_api"] = ddf_fc["precip_sum_api"].fillna(0)
                     if "t_min_api" in ddf_fc.columns:
-                        st.markdown("**Forecast Tmin (°C)**"); st.line_chart(ddf_fc[["t_min_api"]].dropna(), height=200)
+                        st.markdown("**Forecast Tmin (°C)**"); chart(ddf_fc, "t_min_api", 200)
                     if "t_max_api" in ddf_fc.columns:
-                        st.markdown("**Forecast Tmax (°C)**"); st.line_chart(ddf_fc[["t_max_api"]].dropna(), height=200)
+                        st.markdown("**Forecast Tmax (°C)**"); chart(ddf_fc, "t_max_api", 200)
                     if "precip_sum_api" in ddf_fc.columns:
-                        st.markdown("**Forecast Precip (mm/day)**"); st.bar_chart(ddf_fc[["precip_sum_api"]].fillna(0), height=200)
+                        st.markdown("**Forecast Precip (mm/day)**"); chart(ddf_fc, "precip_sum_api", 200, bar=True)
                 else:
                     st.info("No daily forecast data available.")
             except Exception as e:
@@ -181,11 +196,11 @@ if fetch:
             st.markdown("---"); st.subheader("Hourly (Area Mean) — Preview")
             st.dataframe(hdf_mean.head(120))
             if "temperature_2m" in hdf_mean.columns:
-                st.markdown("**Hourly Temperature (°C)**"); st.line_chart(hdf_mean[["temperature_2m"]], height=220)
+                st.markdown("**Hourly Temperature (°C)**"); chart(hdf_mean, "temperature_2m", 220)
             if "relative_humidity_2m" in hdf_mean.columns:
-                st.markdown("**Hourly Relative Humidity (%)**"); st.line_chart(hdf_mean[["relative_humidity_2m"]], height=220)
+                st.markdown("**Hourly Relative Humidity (%)**"); chart(hdf_mean, "relative_humidity_2m", 220)
             if "dew_point_2m" in hdf_mean.columns:
-                st.markdown("**Hourly Dew Point (°C)**"); st.line_chart(hdf_mean[["dew_point_2m"]], height=220)
+                st.markdown("**Hourly Dew Point (°C)**"); chart(hdf_mean, "dew_point_2m", 220)
 
     else:
         if mode == "Pick on Map":
@@ -198,57 +213,56 @@ if fetch:
         with c1:
             st.subheader("Historical")
             with st.spinner("Downloading historical data..."):
+                # Archive and forecast are independent: wall time is the slower of the two, not the sum.
+                # The ~24x larger hourly block is only requested when the hourly-derived columns are shown
+                show_derived = st.session_state.get("show_hourly_derived", False)
+                with ThreadPoolExecutor(max_workers=2) as ex:
+                    fut_hist = ex.submit(fetch_openmeteo_archive, lat, lon, start_date.isoformat(), end_date.isoformat(), tz_str, extended_vars,
+                                         hourly=show_derived)
+                    fut_fc = ex.submit(fetch_openmeteo_forecast, lat, lon, days=int(fc_days), tz_str=tz_str, extended=extended_vars) if show_fc else None
                 try:
-                    hist = fetch_openmeteo_archive(lat, lon, start_date.isoformat(), end_date.isoformat(), tz_str)
+                    hist = fut_hist.result()
                 except Exception as e:
                     st.error(f"Archive fetch failed: {e}")
                     st.stop()
-            hdf = hourly_to_dataframe(hist)
-            ddf_daily_api = daily_to_dataframe(hist)
-            ddf_from_hourly = summarize_daily_from_hourly(hdf)
-            if not ddf_daily_api.empty or not ddf_from_hourly.empty:
-                ddf = ddf_daily_api.join(ddf_from_hourly, how="outer").sort_index().rename(columns={
-                    "temperature_2m_min": "t_min_api",
-                    "temperature_2m_max": "t_max_api",
-                    "precipitation_sum": "precip_sum_api",
-                    "wind_speed_10m_max": "wind_max_api",
-                })
+            ddf = daily_to_dataframe(hist, renamed=True)
+            if not ddf.empty:
+                if show_derived:
+                    # Only RH / dew point need the hourly series; everything else comes from the daily API block
+                    derived = daily_from_hourly(lat, lon, start_date.isoformat(), end_date.isoformat(), tz_str, extended_vars)
+                    ddf = ddf.join(derived, how="left")
                 ddf = add_weather_desc(ddf)
                 if "weathercode" in ddf.columns:
-                    sunny_codes = [0,1] if include_mainly_clear else [0]
-                    ddf["sunny"] = ddf["weathercode"].isin(sunny_codes)
+                    ddf["sunny"] = sunny_mask(ddf["weathercode"], include_mainly_clear)
                 st.caption("Daily summary (API + computed means)")
                 st.dataframe(ddf)
+                if "precip_sum_api" in ddf.columns: ddf["precip_sum_api"] = ddf["precip_sum_api"].fillna(0)
 
                 st.markdown("**Daily Temperature (Min / Max)**")
-                if "t_min_api" in ddf.columns: st.line_chart(ddf[["t_min_api"]].dropna(), height=220)
-                if "t_max_api" in ddf.columns: st.line_chart(ddf[["t_max_api"]].dropna(), height=220)
-                if "rh_mean" in ddf.columns: st.markdown("**Daily Humidity Mean (%)**"); st.line_chart(ddf[["rh_mean"]].dropna(), height=220)
-                if "dewpoint_mean" in ddf.columns: st.markdown("**Daily Dew Point Mean (°C)**"); st.line_chart(ddf[["dewpoint_mean"]].dropna(), height=220)
-                if "precip_sum_api" in ddf.columns: st.markdown("**Daily Precipitation (mm)**"); st.bar_chart(ddf[["precip_sum_api"]].fillna(0), height=220)
-                if "wind_max_api" in ddf.columns: st.markdown("**Daily Max Wind (m/s)**"); st.line_chart(ddf[["wind_max_api"]].dropna(), height=220)
+                if "t_min_api" in ddf.columns: chart(ddf, "t_min_api", 220)
+                if "t_max_api" in ddf.columns: chart(ddf, "t_max_api", 220)
+                if "rh_mean" in ddf.columns: st.markdown("**Daily Humidity Mean (%)**"); chart(ddf, "rh_mean", 220)
+                if "dewpoint_mean" in ddf.columns: st.markdown("**Daily Dew Point Mean (°C)**"); chart(ddf, "dewpoint_mean", 220)
+                if "precip_sum_api" in ddf.columns: st.markdown("**Daily Precipitation (mm)**"); chart(ddf, "precip_sum_api", 220, bar=True)
+                if "wind_max_api" in ddf.columns: st.markdown("**Daily Max Wind (m/s)**"); chart(ddf, "wind_max_api", 220)
             else:
                 st.info("No daily aggregates available.")
 
             # Forecast (point)
-            if show_fc:
+            if fut_fc is not None:
                 try:
-                    fc = fetch_openmeteo_forecast(lat, lon, days=int(fc_days), tz_str=tz_str)
-                    ddf_fc = daily_to_dataframe(fc).rename(columns={
-                        "temperature_2m_min": "t_min_api",
-                        "temperature_2m_max": "t_max_api",
-                        "precipitation_sum": "precip_sum_api",
-                        "wind_speed_10m_max": "wind_max_api",
-                    })
+                    fc = fut_fc.result()
+                    ddf_fc = daily_to_dataframe(fc, renamed=True)
                     st.markdown("---"); st.subheader(f"Forecast (next {fc_days} days)")
                     if not ddf_fc.empty:
                         st.dataframe(ddf_fc)
+                        if "precip_sum_api" in ddf_fc.columns: ddf_fc["precip_sum_api"] = ddf_fc["precip_sum_api"].fillna(0)
                         if "t_min_api" in ddf_fc.columns:
-                            st.markdown("**Forecast Tmin (°C)**"); st.line_chart(ddf_fc[["t_min_api"]].dropna(), height=200)
+                            st.markdown("**Forecast Tmin (°C)**"); chart(ddf_fc, "t_min_api", 200)
                         if "t_max_api" in ddf_fc.columns:
-                            st.markdown("**Forecast Tmax (°C)**"); st.line_chart(ddf_fc[["t_max_api"]].dropna(), height=200)
+                            st.markdown("**Forecast Tmax (°C)**"); chart(ddf_fc, "t_max_api", 200)
                         if "precip_sum_api" in ddf_fc.columns:
-                            st.markdown("**Forecast Precip (mm/day)**"); st.bar_chart(ddf_fc[["precip_sum_api"]].fillna(0), height=200)
+                            st.markdown("**Forecast Precip (mm/day)**"); chart(ddf_fc, "precip_sum_api", 200, bar=True)
                     else:
                         st.info("No daily forecast data available.")
                 except Exception as e:
@@ -257,7 +271,5 @@ if fetch:
         with c2:
             st.subheader("Location & Quick Stats")
             st.metric("Latitude", f"{lat:.3f}"); st.metric("Longitude", f"{lon:.3f}")
-            try:
-                if "elevation" in hist: st.metric("Elevation", f"{hist['elevation']} m")
-            except Exception:
-                pass
+            elevation = hist.get("elevation")
+            if elevation is not None: st.metric("Elevation", f"{elevation} m")
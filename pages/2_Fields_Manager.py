@@ -1,4 +1,4 @@
-import streamlit as st, json, io
+import streamlit as st
 from lib.geoutils import load_orchards, add_orchard, delete_orchard, rename_orchard, parse_polygon_from_output
 
 st.title("🗺️ Fields (Polygons) Manager")
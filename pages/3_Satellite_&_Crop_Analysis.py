@@ -1,37 +1,43 @@
+import json
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 from datetime import date
 from lib.geoutils import load_orchards
 st.title("🛰️ Satellite & Crop Analysis")
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def basemap_html(center: tuple, orch_json: str) -> str:
+    # Display-only map (nothing is read back), so the rendered HTML is reused until the center or fields change
+    import folium
+    m = folium.Map(location=list(center), zoom_start=12, tiles=None)
+    folium.TileLayer("OpenStreetMap", name="OSM").add_to(m)
+    folium.TileLayer(
+        tiles="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+        attr="Esri World Imagery", name="Esri World Imagery", overlay=False, control=True
+    ).add_to(m)
+
+    # Show saved orchards as one overlay: a single GeoJSON payload and LayerControl entry however many fields
+    orch = json.loads(orch_json)
+    if orch:
+        fc = {"type": "FeatureCollection",
+              "features": [{"type": "Feature", "geometry": geom, "properties": {"name": name}} for name, geom in orch.items()]}
+        folium.GeoJson(fc, name="Orchards", tooltip=folium.GeoJsonTooltip(fields=["name"], labels=False)).add_to(m)
+    folium.LayerControl(collapsed=False).add_to(m)
+    return m.get_root().render()
+
 left, right = st.columns([1.1, 0.9], vertical_alignment="top")
 
 with left:
     st.subheader("Basemap & Layers")
     try:
-        from streamlit_folium import st_folium
-        import folium
         center = st.session_state.get("picked_latlon", [40.916, 38.387])
-        m = folium.Map(location=center, zoom_start=12, tiles=None)
-        folium.TileLayer("OpenStreetMap", name="OSM").add_to(m)
-        folium.TileLayer(
-            tiles="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
-            attr="Esri World Imagery", name="Esri World Imagery", overlay=False, control=True
-        ).add_to(m)
-
-        # Show saved orchards as overlays
-        orch = load_orchards()
-        if orch:
-            for name, geom in orch.items():
-                gj = folium.GeoJson(geom, name=name, tooltip=name)
-                gj.add_to(m)
-        folium.LayerControl(collapsed=False).add_to(m)
-
-        st_folium(m, height=520, use_container_width=True, key="sat_map")
+        html = basemap_html(tuple(center), json.dumps(load_orchards(), sort_keys=True))
+        components.html(html, height=520)
         st.caption("Tip: save your fields in the Fields Manager. They appear here as overlays.")
     except Exception as e:
-        st.error("Map component not available. Install streamlit-folium and folium.")
-        st.code("pip install streamlit-folium folium")
+        st.error("Map component not available. Install folium.")
+        st.code("pip install folium")
 
 with right:
     st.subheader("NDVI Time Series (Pro — Earth Engine)")
@@ -79,12 +85,13 @@ with right:
                 col = col.map(scale)
 
                 def stats(img):
-                    mean = img.reduceRegion(ee.Reducer.mean(), ee_poly, 250).get("NDVI")
-                    frac = img.gt(ndvi_thresh).reduceRegion(ee.Reducer.mean(), ee_poly, 250).get("NDVI")
+                    # One reduceRegion over a two-band image (NDVI + above-threshold mask) instead of two passes
+                    both = img.addBands(img.gt(ndvi_thresh).rename("frac"))
+                    r = both.reduceRegion(ee.Reducer.mean(), ee_poly, 250, tileScale=4)
                     return ee.Feature(None, {
                         "date": ee.Date(img.get("system:time_start")).format("YYYY-MM-dd"),
-                        "ndvi_mean": mean,
-                        "frac_above_thresh": frac
+                        "ndvi_mean": r.get("NDVI"),
+                        "frac_above_thresh": r.get("frac")
                     })
 
                 fc = col.map(stats).filter(ee.Filter.notNull(["ndvi_mean"]))
@@ -1,15 +1,38 @@
 import streamlit as st
 import pandas as pd
+import altair as alt
 from datetime import date, timedelta
 
 from lib.data_sources import (
-    geocode_place, fetch_openmeteo_archive, hourly_to_dataframe, daily_to_dataframe,
-    summarize_daily_from_hourly, add_weather_desc, monthly_from_daily, drought_proxy_flags
+    geocode_place, place_label, fetch_openmeteo_archive, fetch_openmeteo_archive_batch, hourly_to_dataframe, daily_to_dataframe,
+    summarize_daily_from_hourly, join_daily_columns, add_weather_desc, sunny_mask, monthly_from_daily, drought_proxy_flags,
+    aggregate_daily_across_points, MEMO_ARCHIVE_TTL_S
 )
-from lib.geoutils import parse_polygon_from_output, sample_points_in_polygon
+from lib.geoutils import sample_points_in_polygon
 
 st.title("🌰 Hazelnut Guide — Monthly Climate & Care")
 
+# Built fresh on every run: st_folium renders (and re-ids) the folium element tree, so one cached
+# instance must not be shared across sessions and threads
+def draw_map(center: tuple):
+    import folium
+    from folium.plugins import Draw
+    m = folium.Map(location=list(center), zoom_start=12, tiles="OpenStreetMap")
+    Draw(
+        export=True,
+        position="topleft",
+        draw_options={
+            "polyline": False,
+            "rectangle": True,
+            "polygon": True,
+            "circle": False,
+            "marker": False,
+            "circlemarker": False,
+        },
+        edit_options={"edit": True, "remove": True},
+    ).add_to(m)
+    return m
+
 # ---------------- Sidebar: scope & dates ----------------
 with st.sidebar:
     st.header("Scope")
@@ -26,13 +49,13 @@ with st.sidebar:
             q = st.text_input("City/Town/Region name", value="Giresun")
             results = geocode_place(q) if q else []
             if results:
-                labels = [
-                    f"{r['name']}, {r.get('admin1','')}, {r.get('country','')} "
-                    f"({r['latitude']:.3f}, {r['longitude']:.3f})"
-                    for r in results
-                ]
-                idx = st.selectbox("Pick a location", range(len(results)), format_func=lambda i: labels[i])
-                sel = results[idx]
+                # Labels are formatted only for the options the selectbox renders; a lone match needs no picker
+                if len(results) == 1:
+                    sel = results[0]
+                    st.caption(place_label(sel))
+                else:
+                    idx = st.selectbox("Pick a location", range(len(results)), format_func=lambda i: place_label(results[i]))
+                    sel = results[idx]
                 lat, lon = sel["latitude"], sel["longitude"]
         else:
             lat = st.number_input(
@@ -46,47 +69,39 @@ with st.sidebar:
                 format="%.6f",
             )
     else:
-        # Draw a polygon for the field
-        st.caption("Draw a polygon on the map to aggregate over the orchard area.")
-        try:
-            from streamlit_folium import st_folium
-            import folium
-            from folium.plugins import Draw
-
-            center = st.session_state.get("picked_latlon", [40.916, 38.387])
-            m = folium.Map(location=center, zoom_start=12, tiles="OpenStreetMap")
-            draw = Draw(
-                export=True,
-                position="topleft",
-                draw_options={
-                    "polyline": False,
-                    "rectangle": True,
-                    "polygon": True,
-                    "circle": False,
-                    "marker": False,
-                    "circlemarker": False,
-                },
-                edit_options={"edit": True, "remove": True},
-            )
-            draw.add_to(m)
-            out = st_folium(m, height=420, use_container_width=True)
-            geom = None
-            if out:
-                g_last = out.get("last_active_drawing")
-                if g_last and "geometry" in g_last:
-                    geom = g_last["geometry"]
-                elif out.get("all_drawings"):
-                    geom = out["all_drawings"][-1].get("geometry")
-            if geom and geom.get("type") == "Polygon":
-                st.session_state["orchard_geom"] = geom
-                pts = sample_points_in_polygon(geom, max_points=9)
-                st.session_state["sampled_points"] = pts
-                st.success(f"Using {len(pts)} sampling points in polygon.")
-            else:
-                st.info("Draw a polygon to summarize that area.")
-        except Exception:
-            st.warning("Map component not available. Install streamlit-folium and folium.")
-            st.code("pip install streamlit-folium folium")
+        # Draw a polygon for the field; once one is saved the map editor is opt-in, so date tweaks
+        # don't re-ship the map component on every rerun
+        saved_geom = st.session_state.get("orchard_geom")
+        if st.checkbox("Show map editor", value=not saved_geom, key="hazelnut_map_editor"):
+            st.caption("Draw a polygon on the map to aggregate over the orchard area.")
+            try:
+                from streamlit_folium import st_folium
+
+                m = draw_map(tuple(st.session_state.get("picked_latlon", [40.916, 38.387])))
+                out = st_folium(m, height=420, use_container_width=True, key="hazelnut_map",
+                                returned_objects=["last_active_drawing", "all_drawings"])
+                geom = None
+                if out:
+                    g_last = out.get("last_active_drawing")
+                    if g_last and "geometry" in g_last:
+                        geom = g_last["geometry"]
+                    elif out.get("all_drawings"):
+                        geom = out["all_drawings"][-1].get("geometry")
+                if geom and geom.get("type") == "Polygon":
+                    st.session_state["orchard_geom"] = geom
+                    pts = sample_points_in_polygon(geom, max_points=9)
+                    st.session_state["sampled_points"] = pts
+                    st.success(f"Using {len(pts)} sampling points in polygon.")
+                else:
+                    st.info("Draw a polygon to summarize that area.")
+            except Exception:
+                st.warning("Map component not available. Install streamlit-folium and folium.")
+                st.code("pip install streamlit-folium folium")
+        elif saved_geom:
+            pts = sample_points_in_polygon(saved_geom, max_points=9)
+            st.success(f"Using the saved field polygon ({len(pts)} sampling points).")
+        else:
+            st.info("Draw a field first: tick \"Show map editor\" to open the map.")
 
     st.header("Reference period")
     today = date.today()
@@ -106,26 +121,75 @@ with st.sidebar:
 # ---------------- Helpers ----------------
 def build_daily_for_point(la: float, lo: float, start_d, end_d, tz: str) -> pd.DataFrame:
     try:
-        payload = fetch_openmeteo_archive(la, lo, start_d.isoformat(), end_d.isoformat(), tz)
+        return point_daily(round(la, 4), round(lo, 4), start_d.isoformat(), end_d.isoformat(), tz)
     except Exception as e:
         st.error(f"Archive fetch failed at point ({la:.4f}, {lo:.4f}): {e}")
         return pd.DataFrame()
 
+# Whole fetch -> daily pipeline memoized on primitive keys, so repeat clicks skip the frame building too
+@st.cache_data(ttl=MEMO_ARCHIVE_TTL_S, max_entries=64, show_spinner=False)
+def point_daily(la: float, lo: float, start_iso: str, end_iso: str, tz: str) -> pd.DataFrame:
+    return build_daily(fetch_openmeteo_archive(la, lo, start_iso, end_iso, tz))
+
+@st.cache_data(ttl=MEMO_ARCHIVE_TTL_S, max_entries=64, show_spinner=False)
+def field_daily(pts: tuple, start_iso: str, end_iso: str, tz: str) -> pd.DataFrame:
+    # One multi-location request covers every sample point
+    payloads = fetch_openmeteo_archive_batch(list(pts), start_iso, end_iso, tz)
+    return aggregate_daily_across_points([d for d in map(build_daily, payloads) if not d.empty])
+
+def build_daily(payload) -> pd.DataFrame:
     hdf = hourly_to_dataframe(payload)
-    ddf_api = daily_to_dataframe(payload).rename(
-        columns={
-            "temperature_2m_min": "t_min_api",
-            "temperature_2m_max": "t_max_api",
-            "precipitation_sum": "precip_sum_api",
-            "wind_speed_10m_max": "wind_max_api",
-        }
-    )
-    ddf = ddf_api.join(summarize_daily_from_hourly(hdf), how="outer").sort_index()
+    ddf_api = daily_to_dataframe(payload, renamed=True)
+    ddf = join_daily_columns(ddf_api, summarize_daily_from_hourly(hdf))
     ddf = add_weather_desc(ddf)
     if "weathercode" in ddf.columns:
-        ddf["sunny"] = ddf["weathercode"].isin([0, 1])
+        ddf["sunny"] = sunny_mask(ddf["weathercode"])
     return ddf
 
+# Constant table: the page script reruns on every click, so memoize instead of keeping a module global
+@st.cache_data(show_spinner=False)
+def build_guidance_table() -> pd.DataFrame:
+    rows = [
+        ("Jan","Dormant","Drainage, frost protection","Structural pruning; sanitation; soil sampling","Cankers; sanitize mummies"),
+        ("Feb","Dormant / catkin shed","Avoid waterlogging/frost","Finish pruning; plan nutrition","Cankers; dormant sprays if local guidance"),
+        ("Mar","Budbreak","Rains okay; track frost","First N after growth; pre-emergent; sucker control","Aphids/leafrollers; bud mite"),
+        ("Apr","Rapid growth","Watch dry spells","Split N if needed; maintain weed strip","Leafrollers; place traps"),
+        ("May","Nut set","Irrigation may begin","Finish N by late spring; foliar only if deficient","Aphids; bud mite (region)"),
+        ("Jun","Kernel growth","Irrigation important","Mow floor; maintain cover","Filbertworm monitoring; stink bugs"),
+        ("Jul","Kernel fill","Irrigation critical","Avoid late heavy N; K by tests","Filbertworm timing; BMSB scouting"),
+        ("Aug","Maturity approaching","Avoid water stress","Leaf sampling for nutrition; prep floor","Continue pest monitoring"),
+        ("Sep","Harvest begins","Keep floor dry","Mow/sweep; timely harvest","Wasps; vertebrates"),
+        ("Oct","Harvest / post","Wetter; avoid rutting","Finish harvest; remove mummies; soil tests","Sanitation for next season"),
+        ("Nov","Leaf fall","High rainfall","Lime/P/K by tests; cover crop","Canker scouting after leaf drop"),
+        ("Dec","Dormant","Storm season","Plan pruning; service sprayers","Rodent guards; sanitation"),
+    ]
+    return pd.DataFrame(rows, columns=["Month","Phenology","Climate Focus","Orchard Ops","Pest/Disease Focus"])
+
+# (title, columns, bar?) for each monthly panel; a panel is drawn only when all its columns exist
+MONTHLY_PANELS = [
+    ("Monthly precipitation (mm)", ["precip_total"], True),
+    ("Monthly temperature (mean daily min/max, °C)", ["tmin_mean", "tmax_mean"], False),
+    ("Monthly mean RH (%)", ["rh_mean"], False),
+    ("Sunny days per month", ["sunny_days"], True),
+    ("Monthly heat-stress days (≥35°C)", ["heat_days_35C"], True),
+]
+
+def monthly_charts(monthly: pd.DataFrame):
+    # One vconcat spec with the month table as shared top-level data: shipped once instead of once per chart
+    src = monthly.rename_axis("month").reset_index()
+    panels = []
+    for title, cols, bar in MONTHLY_PANELS:
+        if not all(c in src.columns for c in cols): continue
+        c = alt.Chart(title=title).transform_fold(cols, as_=["series", "value"]).encode(
+            x=alt.X("month:O", title=None), y=alt.Y("value:Q", title=None), tooltip=["month:O", "series:N", "value:Q"])
+        if len(cols) > 1: c = c.encode(color=alt.Color("series:N", title=None))
+        panels.append((c.mark_bar() if bar else c.mark_line()).properties(height=200))
+    return alt.vconcat(*panels, data=src) if panels else None
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def csv_bytes(df: pd.DataFrame, index: bool = True) -> bytes:
+    return df.to_csv(index=index).encode("utf-8")
+
 # ---------------- Main action ----------------
 if fetch:
     st.subheader("1) Climate summary from your period")
@@ -137,22 +201,15 @@ if fetch:
             st.stop()
 
         # Aggregate multiple points over polygon
-        frames = []
-        for la, lo in pts:
-            d = build_daily_for_point(la, lo, start_date, end_date, tz_str)
-            if not d.empty:
-                frames.append(d)
-
-        if not frames:
+        try:
+            daily = field_daily(tuple(map(tuple, pts)), start_date.isoformat(), end_date.isoformat(), tz_str)
+        except Exception as e:
+            st.error(f"Archive fetch failed for {len(pts)} sampled points: {e}")
+            st.stop()
+        if daily.empty:
             st.warning("No daily data returned for any sampled point.")
             st.stop()
 
-        # Align and average numeric columns across points
-        all_idx = sorted(set().union(*[f.index for f in frames]))
-        aligned = [f.reindex(all_idx) for f in frames]
-        stacked = pd.concat(aligned, axis=1, keys=range(len(aligned)))
-        daily = stacked.groupby(level=1, axis=1).mean(numeric_only=True)
-
     else:
         if lat is None or lon is None:
             st.warning("Please select a valid point location.")
@@ -168,25 +225,13 @@ if fetch:
     monthly = monthly_from_daily(daily)
     st.dataframe(monthly)
 
-    if "precip_total" in monthly.columns:
-        st.markdown("**Monthly precipitation (mm)**")
-        st.bar_chart(monthly[["precip_total"]])
-    if "tmin_mean" in monthly.columns and "tmax_mean" in monthly.columns:
-        st.markdown("**Monthly temperature (mean daily min/max, °C)**")
-        st.line_chart(monthly[["tmin_mean", "tmax_mean"]])
-    if "rh_mean" in monthly.columns:
-        st.markdown("**Monthly mean RH (%)**")
-        st.line_chart(monthly[["rh_mean"]])
-    if "sunny_days" in monthly.columns:
-        st.markdown("**Sunny days per month**")
-        st.bar_chart(monthly[["sunny_days"]])
-    if "heat_days_35C" in monthly.columns:
-        st.markdown("**Monthly heat-stress days (≥35°C)**")
-        st.bar_chart(monthly[["heat_days_35C"]])
+    charts = monthly_charts(monthly)
+    if charts is not None:
+        st.altair_chart(charts, use_container_width=True)
 
     dr = drought_proxy_flags(monthly)
-    if not dr.empty and dr.any():
-        months_flagged = list(monthly.index[dr])
+    if dr.any():  # also False when empty
+        months_flagged = monthly.index[dr.to_numpy()].astype(str).tolist()  # labels are already "YYYY-MM" strings
         st.warning(
             "Drought-like months (heuristic): "
             + ", ".join(months_flagged)
@@ -195,44 +240,28 @@ if fetch:
 
     st.subheader("2) Best-practice tasks by month (guide)")
 
-    def build_guidance_table():
-        rows = [
-            ("Jan","Dormant","Drainage, frost protection","Structural pruning; sanitation; soil sampling","Cankers; sanitize mummies"),
-            ("Feb","Dormant / catkin shed","Avoid waterlogging/frost","Finish pruning; plan nutrition","Cankers; dormant sprays if local guidance"),
-            ("Mar","Budbreak","Rains okay; track frost","First N after growth; pre-emergent; sucker control","Aphids/leafrollers; bud mite"),
-            ("Apr","Rapid growth","Watch dry spells","Split N if needed; maintain weed strip","Leafrollers; place traps"),
-            ("May","Nut set","Irrigation may begin","Finish N by late spring; foliar only if deficient","Aphids; bud mite (region)"),
-            ("Jun","Kernel growth","Irrigation important","Mow floor; maintain cover","Filbertworm monitoring; stink bugs"),
-            ("Jul","Kernel fill","Irrigation critical","Avoid late heavy N; K by tests","Filbertworm timing; BMSB scouting"),
-            ("Aug","Maturity approaching","Avoid water stress","Leaf sampling for nutrition; prep floor","Continue pest monitoring"),
-            ("Sep","Harvest begins","Keep floor dry","Mow/sweep; timely harvest","Wasps; vertebrates"),
-            ("Oct","Harvest / post","Wetter; avoid rutting","Finish harvest; remove mummies; soil tests","Sanitation for next season"),
-            ("Nov","Leaf fall","High rainfall","Lime/P/K by tests; cover crop","Canker scouting after leaf drop"),
-            ("Dec","Dormant","Storm season","Plan pruning; service sprayers","Rodent guards; sanitation"),
-        ]
-        return pd.DataFrame(rows, columns=["Month","Phenology","Climate Focus","Orchard Ops","Pest/Disease Focus"])
-
     guide = build_guidance_table()
     st.dataframe(guide)
 
     with st.expander("Actionable notes (short)"):
-        for _, r in guide.iterrows():
-            st.markdown(
-                f"**{r['Month']} — {r['Phenology']}**  \n"
-                f"- Climate: {r['Climate Focus']}  \n"
-                f"- Ops: {r['Orchard Ops']}  \n"
-                f"- IPM: {r['Pest/Disease Focus']}"
-            )
+        # One element for all 12 months; positional tuples since some columns have spaces
+        st.markdown("\n\n".join(
+            f"**{month} — {phen}**  \n"
+            f"- Climate: {climate}  \n"
+            f"- Ops: {ops}  \n"
+            f"- IPM: {ipm}"
+            for month, phen, climate, ops, ipm in guide.itertuples(index=False, name=None)
+        ))
 
     st.download_button(
         "Download monthly climate CSV",
-        monthly.to_csv().encode("utf-8"),
+        csv_bytes(monthly),
         "monthly_climate_summary.csv",
         "text/csv",
     )
     st.download_button(
         "Download guide CSV",
-        guide.to_csv(index=False).encode("utf-8"),
+        csv_bytes(guide, index=False),
         "hazelnut_monthly_guide.csv",
         "text/csv",
     )